@@ -1,15 +1,25 @@
 import streamlit as st
 import os
+import io
+import base64
+import html
 from PIL import Image
 import numpy as np
+import cv2
 import datetime
 import shutil
 import pyodbc
+import re
+import socket
 import sqlite3
 import subprocess
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from utils.facerec import FaceRecognitionSystem
 from utils.drive_integration import GoogleDriveManager
+from utils.sql_pool import get_pool
 
 st.set_page_config(
     page_title="Smart Attendance System",
@@ -17,13 +27,67 @@ st.set_page_config(
     layout="wide"
 )
 
+DRIVE_CREDENTIALS_PATH = 'C:/smart-attendance-system/credentials/smartattendancesystem-465906-1d185d330be1.json'
+
+# Attendance history rows fetched per "Load more" click
+HISTORY_PAGE_SIZE = 100
+
+# Oldest SQLite builds cap a statement at 999 bound parameters
+SQLITE_MAX_PARAMS = 999
+
+def _chunked(seq, size):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+# Seconds to wait for a SQL Server login before trying the next candidate
+LOGIN_TIMEOUT = 1
+
+# Seconds a SQLite fallback is kept before SQL Server is probed again
+SQLITE_RETRY_SECONDS = 300
+
+def _connection_string(server, database):
+    return f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};DATABASE={database};Trusted_Connection=yes;'
+
+class _NoServerFound(Exception):
+    pass
+
+@st.cache_data(persist="disk", show_spinner=False)
+def _remembered_server(candidates, database, hostname):
+    """Return the first reachable server; raises when none answer so the miss is never cached"""
+    # hostname only keys the disk cache so it is never reused on another machine
+    for server in candidates:
+        try:
+            # Park the probe connection in the pool so the real connect can reuse it
+            pool = get_pool(_connection_string(server, database), timeout=LOGIN_TIMEOUT)
+            pool.release(pool.acquire())
+            return server
+        except pyodbc.InterfaceError as e:
+            # IM002: the ODBC driver itself is missing, so every candidate will fail
+            if e.args and e.args[0] == 'IM002':
+                break
+        except Exception:
+            continue
+    raise _NoServerFound()
+
+def _probe_server(candidates, database, hostname):
+    """Return the first reachable server, or None to fall back to SQLite"""
+    try:
+        return _remembered_server(candidates, database, hostname)
+    except _NoServerFound:
+        return None
+
 class SQLServerManager:
     def __init__(self, server=None, database="auto_attendance"):
         self.server = server
         self.database = database
         self.connection = None
+        self._pool = None
         self.use_sqlite = False
         self.last_error = None
+        self._tables_ready = False
+        self._connected_at = 0.0
+        # The manager is shared across sessions, so serialize cursor use
+        self._lock = threading.Lock()
     
     def connect(self):
         try:
@@ -39,19 +103,27 @@ class SQLServerManager:
             if self.server:
                 servers_to_try = [self.server] + servers_to_try
             
-            for server in servers_to_try:
+            server = _probe_server(tuple(servers_to_try), self.database, socket.gethostname())
+            if server:
                 try:
-                    conn_str = f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};DATABASE={self.database};Trusted_Connection=yes;'
-                    self.connection = pyodbc.connect(conn_str)
+                    pool = get_pool(_connection_string(server, self.database), timeout=LOGIN_TIMEOUT)
+                    connection = pool.acquire()
+                    connection.autocommit = False
+                    # Only remember the pool once it has handed out a working connection
+                    self.connection, self._pool = connection, pool
                     st.success(f"✅ Connected to server: {server}")
                     return True
-                except Exception as e:
-                    continue
+                except Exception:
+                    # The remembered server went away; probe again next time
+                    _remembered_server.clear()
             
             # Fallback to SQLite
             st.warning("⚠️ SQL Server not available. Using SQLite as fallback.")
-            self.connection = sqlite3.connect('attendance.db')
+            # A larger statement cache keeps the report and history queries prepared
+            self.connection = sqlite3.connect('attendance.db', check_same_thread=False, cached_statements=256)
             self.use_sqlite = True
+            self._connected_at = time.monotonic()
+            self._tune_sqlite()
             return True
             
         except Exception as e:
@@ -65,218 +137,288 @@ class SQLServerManager:
             4. Try using SQL Server Authentication instead
             """)
             return False
+
+    def _tune_sqlite(self):
+        # WAL + synchronous=NORMAL avoids an fsync on every commit; the larger
+        # page cache and in-memory temp store keep report inserts off the disk
+        self.connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA cache_size=-65536;
+            PRAGMA temp_store=MEMORY;
+        """)
+
+    def _cursor(self):
+        cursor = self.connection.cursor()
+        if not self.use_sqlite:
+            # Let pyodbc bind executemany parameters as a single array
+            cursor.fast_executemany = True
+        return cursor
     
     def create_tables(self):
         if not self.connection:
             return False
+        if self._tables_ready:
+            return True
         
-        try:
-            if self.use_sqlite:
-                # SQLite table creation
-                cursor = self.connection.cursor()
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS attendance (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        class_name TEXT,
-                        attendance_date DATETIME,
-                        present_count INTEGER,
-                        absent_count INTEGER,
-                        unrecognized_count INTEGER,
-                        average_confidence REAL,
-                        report_text TEXT,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS attendance_details (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        attendance_id INTEGER,
-                        roll_no TEXT,
-                        student_name TEXT,
-                        status TEXT,
-                        confidence REAL,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (attendance_id) REFERENCES attendance (id)
-                    )
-                """)
-                self.connection.commit()
-                return True
-            else:
-                # SQL Server table creation
-                cursor = self.connection.cursor()
-                
-                # Check if tables already exist
-                cursor.execute("""
-                    SELECT COUNT(*) 
-                    FROM INFORMATION_SCHEMA.TABLES 
-                    WHERE TABLE_NAME = 'attendance'
-                """)
-                attendance_exists = cursor.fetchone()[0] > 0
-                
-                cursor.execute("""
-                    SELECT COUNT(*) 
-                    FROM INFORMATION_SCHEMA.TABLES 
-                    WHERE TABLE_NAME = 'attendance_details'
-                """)
-                details_exists = cursor.fetchone()[0] > 0
-                
-                # Create attendance table if it doesn't exist
-                if not attendance_exists:
+        with self._lock:
+            try:
+                if self.use_sqlite:
+                    # SQLite table creation
+                    cursor = self._cursor()
                     cursor.execute("""
-                        CREATE TABLE attendance (
-                            id INT IDENTITY(1,1) PRIMARY KEY,
-                            class_name NVARCHAR(100),
+                        CREATE TABLE IF NOT EXISTS attendance (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            class_name TEXT,
                             attendance_date DATETIME,
-                            present_count INT,
-                            absent_count INT,
-                            unrecognized_count INT,
-                            average_confidence FLOAT,
-                            report_text NVARCHAR(MAX),
-                            created_at DATETIME DEFAULT GETDATE()
+                            present_count INTEGER,
+                            absent_count INTEGER,
+                            unrecognized_count INTEGER,
+                            average_confidence REAL,
+                            report_text TEXT,
+                            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
                         )
                     """)
-                
-                # Create attendance_details table if it doesn't exist
-                if not details_exists:
                     cursor.execute("""
-                        CREATE TABLE attendance_details (
-                            id INT IDENTITY(1,1) PRIMARY KEY,
-                            attendance_id INT FOREIGN KEY REFERENCES attendance(id),
-                            roll_no NVARCHAR(50),
-                            student_name NVARCHAR(100),
-                            status NVARCHAR(20),
-                            confidence FLOAT NULL,
-                            created_at DATETIME DEFAULT GETDATE()
+                        CREATE TABLE IF NOT EXISTS attendance_details (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            attendance_id INTEGER,
+                            roll_no TEXT,
+                            student_name TEXT,
+                            status TEXT,
+                            confidence REAL,
+                            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                            FOREIGN KEY (attendance_id) REFERENCES attendance (id)
                         )
                     """)
-                
-                self.connection.commit()
-                return True
+                    # History is filtered and ordered by date; serve it from an index scan
+                    cursor.execute("CREATE INDEX IF NOT EXISTS ix_att_date ON attendance (attendance_date DESC)")
+                    self.connection.commit()
+                    self._tables_ready = True
+                    return True
+                else:
+                    # SQL Server table creation, existence checks and DDL in one batch
+                    cursor = self._cursor()
+                    cursor.execute("""
+                        IF OBJECT_ID('attendance', 'U') IS NULL
+                            CREATE TABLE attendance (
+                                id INT IDENTITY(1,1) PRIMARY KEY,
+                                class_name NVARCHAR(100),
+                                attendance_date DATETIME,
+                                present_count INT,
+                                absent_count INT,
+                                unrecognized_count INT,
+                                average_confidence FLOAT,
+                                report_text NVARCHAR(MAX),
+                                created_at DATETIME DEFAULT GETDATE()
+                            );
+                        IF OBJECT_ID('attendance_details', 'U') IS NULL
+                            CREATE TABLE attendance_details (
+                                id INT IDENTITY(1,1) PRIMARY KEY,
+                                attendance_id INT FOREIGN KEY REFERENCES attendance(id),
+                                roll_no NVARCHAR(50),
+                                student_name NVARCHAR(100),
+                                status NVARCHAR(20),
+                                confidence FLOAT NULL,
+                                created_at DATETIME DEFAULT GETDATE()
+                            );
+                        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_att_date'
+                                       AND object_id = OBJECT_ID('attendance'))
+                            CREATE INDEX ix_att_date ON attendance (attendance_date DESC);
+                    """)
+                    self.connection.commit()
+                    self._tables_ready = True
+                    return True
             
-        except Exception as e:
-            self.last_error = str(e)
-            st.error(f"Table creation failed: {str(e)}")
-            return False
+            except Exception as e:
+                self.last_error = str(e)
+                st.error(f"Table creation failed: {str(e)}")
+                return False
     
     def save_attendance_report(self, class_name, present, absent, unrecognized_count, avg_conf, report_text):
         if not self.connection:
             return False
         
-        try:
-            attendance_date = datetime.datetime.now()
+        with self._lock:
+            try:
+                attendance_date = datetime.datetime.now()
             
-            if self.use_sqlite:
-                # SQLite implementation
-                cursor = self.connection.cursor()
-                
-                # Insert main attendance record
-                cursor.execute("""
-                    INSERT INTO attendance (class_name, attendance_date, present_count, absent_count, 
-                                          unrecognized_count, average_confidence, report_text)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (class_name, attendance_date, len(present), len(absent), 
-                     unrecognized_count, avg_conf, report_text))
+                if self.use_sqlite:
+                    # SQLite implementation
+                    cursor = self._cursor()
+                    # Take the write lock up front so the header and detail inserts never
+                    # have to upgrade a read transaction midway (SQLITE_BUSY under WAL)
+                    cursor.execute("BEGIN IMMEDIATE")
                 
-                # Get the inserted ID
-                attendance_id = cursor.lastrowid
-                
-                # Insert present students
-                for (roll, name), conf in present.items():
-                    cursor.execute("""
-                        INSERT INTO attendance_details (attendance_id, roll_no, student_name, status, confidence)
-                        VALUES (?, ?, ?, 'present', ?)
-                    """, (attendance_id, roll, name, conf))
-                
-                # Insert absent students
-                for roll, name in absent:
+                    # Insert main attendance record
                     cursor.execute("""
-                        INSERT INTO attendance_details (attendance_id, roll_no, student_name, status)
-                        VALUES (?, ?, ?, 'absent')
-                    """, (attendance_id, roll, name))
-                
-                self.connection.commit()
-                return attendance_id
-                
-            else:
-                # SQL Server implementation
-                cursor = self.connection.cursor()
-                
-                # Insert main attendance record
-                cursor.execute("""
-                    INSERT INTO attendance (class_name, attendance_date, present_count, absent_count, 
-                                          unrecognized_count, average_confidence, report_text)
-                    OUTPUT INSERTED.id
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, class_name, attendance_date, len(present), len(absent), 
-                   unrecognized_count, avg_conf, report_text)
+                        INSERT INTO attendance (class_name, attendance_date, present_count, absent_count, 
+                                              unrecognized_count, average_confidence, report_text)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (class_name, attendance_date, len(present), len(absent), 
+                         unrecognized_count, avg_conf, report_text))
                 
-                # Get the inserted ID
-                attendance_id = cursor.fetchone()[0]
+                    # Get the inserted ID
+                    attendance_id = cursor.lastrowid
+
+                    present_rows = [(attendance_id, roll, name, 'present', conf) for (roll, name), conf in present.items()]
+                    absent_rows = [(attendance_id, roll, name, 'absent', None) for roll, name in absent]
+
+                    # Insert present and absent students as multi-row VALUES statements,
+                    # each chunk kept under SQLite's bound-parameter limit
+                    for chunk in _chunked(present_rows + absent_rows, SQLITE_MAX_PARAMS // 5):
+                        cursor.execute(
+                            "INSERT INTO attendance_details (attendance_id, roll_no, student_name, status, confidence) VALUES "
+                            + ", ".join(["(?, ?, ?, ?, ?)"] * len(chunk)),
+                            [value for row in chunk for value in row]
+                        )
+
+                    # Single commit so the header and all detail rows land in one transaction
+                    self.connection.commit()
+                    return attendance_id
                 
-                # Insert present students
-                for (roll, name), conf in present.items():
-                    cursor.execute("""
-                        INSERT INTO attendance_details (attendance_id, roll_no, student_name, status, confidence)
-                        VALUES (?, ?, ?, 'present', ?)
-                    """, attendance_id, roll, name, conf)
+                else:
+                    # SQL Server implementation
+                    cursor = self._cursor()
                 
-                # Insert absent students
-                for roll, name in absent:
+                    # Insert main attendance record
                     cursor.execute("""
-                        INSERT INTO attendance_details (attendance_id, roll_no, student_name, status)
-                        VALUES (?, ?, ?, 'absent')
-                    """, attendance_id, roll, name)
+                        INSERT INTO attendance (class_name, attendance_date, present_count, absent_count, 
+                                              unrecognized_count, average_confidence, report_text)
+                        OUTPUT INSERTED.id
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, class_name, attendance_date, len(present), len(absent), 
+                       unrecognized_count, avg_conf, report_text)
                 
-                self.connection.commit()
-                return attendance_id
+                    # Get the inserted ID
+                    attendance_id = cursor.fetchone()[0]
+
+                    present_rows = [(attendance_id, roll, name, 'present', conf) for (roll, name), conf in present.items()]
+                    absent_rows = [(attendance_id, roll, name, 'absent', None) for roll, name in absent]
+                    detail_rows = present_rows + absent_rows
+
+                    # Insert present and absent students as one typed parameter array
+                    # (pyodbc rejects an empty parameter list)
+                    if detail_rows:
+                        cursor.setinputsizes([
+                            (pyodbc.SQL_INTEGER, 0, 0),
+                            (pyodbc.SQL_WVARCHAR, 50, 0),
+                            (pyodbc.SQL_WVARCHAR, 100, 0),
+                            (pyodbc.SQL_WVARCHAR, 20, 0),
+                            (pyodbc.SQL_FLOAT, 0, 0)
+                        ])
+                        cursor.executemany("""
+                            INSERT INTO attendance_details (attendance_id, roll_no, student_name, status, confidence)
+                            VALUES (?, ?, ?, ?, ?)
+                        """, detail_rows)
+
+                    # Single commit so the header and all detail rows land in one transaction
+                    self.connection.commit()
+                    return attendance_id
             
-        except Exception as e:
-            self.last_error = str(e)
-            st.error(f"Failed to save attendance: {str(e)}")
-            # Show detailed error information
-            with st.expander("Detailed Error Information"):
-                st.code(traceback.format_exc())
-            return None
+            except Exception as e:
+                # Don't leave a half-written report for the next commit to pick up
+                try:
+                    self.connection.rollback()
+                except Exception:
+                    pass
+                self.last_error = str(e)
+                st.error(f"Failed to save attendance: {str(e)}")
+                # Show detailed error information
+                with st.expander("Detailed Error Information"):
+                    st.code(traceback.format_exc())
+                return None
     
-    def get_attendance_history(self, days=30):
+    def get_attendance_history(self, days=30, limit=100, offset=0):
         if not self.connection:
             return []
         
-        try:
-            if self.use_sqlite:
-                # SQLite implementation
-                cursor = self.connection.cursor()
-                cursor.execute("""
-                    SELECT id, class_name, attendance_date, present_count, 
-                           absent_count, unrecognized_count, average_confidence
-                    FROM attendance
-                    WHERE attendance_date >= datetime('now', ?)
-                    ORDER BY attendance_date DESC
-                """, (f'-{days} days',))
+        with self._lock:
+            try:
+                if self.use_sqlite:
+                    # SQLite implementation
+                    cursor = self._cursor()
+                    cursor.execute("""
+                        SELECT id, class_name, attendance_date, present_count, 
+                               absent_count, unrecognized_count, average_confidence
+                        FROM attendance
+                        WHERE attendance_date >= datetime('now', ?)
+                        ORDER BY attendance_date DESC
+                        LIMIT ? OFFSET ?
+                    """, (f'-{days} days', limit, offset))
                 
-                return cursor.fetchall()
+                    return cursor.fetchmany(limit)
                 
-            else:
-                # SQL Server implementation
-                cursor = self.connection.cursor()
-                cursor.execute("""
-                    SELECT a.id, a.class_name, a.attendance_date, a.present_count, 
-                           a.absent_count, a.unrecognized_count, a.average_confidence
-                    FROM attendance a
-                    WHERE a.attendance_date >= DATEADD(day, -?, GETDATE())
-                    ORDER BY a.attendance_date DESC
-                """, days)
+                else:
+                    # SQL Server implementation
+                    cursor = self._cursor()
+                    cursor.execute("""
+                        SELECT a.id, a.class_name, a.attendance_date, a.present_count, 
+                               a.absent_count, a.unrecognized_count, a.average_confidence
+                        FROM attendance a
+                        WHERE a.attendance_date >= DATEADD(day, -?, GETDATE())
+                        ORDER BY a.attendance_date DESC
+                        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+                    """, days, offset, limit)
                 
-                return cursor.fetchall()
+                    return cursor.fetchmany(limit)
             
-        except Exception as e:
-            self.last_error = str(e)
-            st.error(f"Failed to fetch attendance history: {str(e)}")
-            return []
+            except Exception as e:
+                self.last_error = str(e)
+                st.error(f"Failed to fetch attendance history: {str(e)}")
+                return []
     
+    def is_alive(self):
+        """True while the connection answers; a SQLite fallback expires so SQL Server gets retried"""
+        if not self.connection:
+            return False
+        if self.use_sqlite:
+            return time.monotonic() - self._connected_at < SQLITE_RETRY_SECONDS
+        with self._lock:
+            try:
+                self.connection.execute("SELECT 1").fetchone()
+                return True
+            except pyodbc.Error:
+                return False
+
     def close(self):
         if self.connection:
-            self.connection.close()
+            if self._pool and not self.use_sqlite:
+                self._pool.release(self.connection)
+            else:
+                self.connection.close()
+            self.connection = None
+
+# Optional: query the service manager in-process when pywin32 is installed
+try:
+    import win32service
+    import win32serviceutil
+except ImportError:
+    win32serviceutil = None
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _service_states(services):
+    """Map service names to their state; services that are not installed are absent"""
+    if win32serviceutil is not None:
+        states = {}
+        for service in services:
+            try:
+                status = win32serviceutil.QueryServiceStatus(service)[1]
+            except Exception:
+                continue
+            states[service] = "RUNNING" if status == win32service.SERVICE_RUNNING else "STOPPED"
+        return states
+    # Fallback: one sc call that lists every service
+    try:
+        result = subprocess.run(
+            ['sc', 'query', 'type=', 'service', 'state=', 'all'],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+    except Exception:
+        return {}
+    return dict(re.findall(r"SERVICE_NAME:\s*(\S+).*?STATE\s*:\s*\d+\s+(\w+)", result.stdout, re.S))
 
 def check_sql_server_status():
     """Check if SQL Server services are running"""
@@ -290,21 +432,16 @@ def check_sql_server_status():
         "SQLBrowser"
     ]
     
+    states = _service_states(tuple(services))
     results = []
     for service in services:
-        try:
-            result = subprocess.run(
-                ['sc', 'query', service], 
-                capture_output=True, 
-                text=True, 
-                timeout=10
-            )
-            if "RUNNING" in result.stdout:
-                results.append(f"✅ {service}: Running")
-            else:
-                results.append(f"❌ {service}: Not running")
-        except:
+        state = states.get(service)
+        if state is None:
             results.append(f"❓ {service}: Not found")
+        elif state == "RUNNING":
+            results.append(f"✅ {service}: Running")
+        else:
+            results.append(f"❌ {service}: Not running")
     
     st.write("**SQL Server Services Status:**")
     for result in results:
@@ -324,85 +461,151 @@ def test_sql_server_connection(server, database, use_windows_auth=True, username
     except Exception as e:
         return False, f"❌ Connection failed: {str(e)}"
 
+def _sql_manager_usable(sql_manager):
+    # A dead connection object is still truthy, so check it on every cache hit
+    if sql_manager.is_alive():
+        return True
+    try:
+        sql_manager.close()
+    except Exception:
+        pass
+    return False
+
+@st.cache_resource(validate=_sql_manager_usable)
+def get_sql_manager():
+    sql_manager = SQLServerManager()
+    if sql_manager.connect():
+        sql_manager.create_tables()
+    return sql_manager
+
+@st.cache_data(ttl=300, show_spinner=False)
+def drive_credentials_available(credentials_path=DRIVE_CREDENTIALS_PATH):
+    return os.path.exists(credentials_path)
+
+@st.cache_resource
+def get_drive(credentials_path=DRIVE_CREDENTIALS_PATH):
+    # Credential parsing and the discovery document are paid once per process
+    return GoogleDriveManager(credentials_path)
+
+@st.cache_resource
+def get_recognition_executor():
+    # dlib releases the GIL while detecting and encoding, so threads overlap across sessions
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def recognize_cached(_fr, img_bytes, model_version):
+    # Keyed on the upload's bytes and the model version, so reruns skip detection entirely
+    img_np = np.asarray(Image.open(io.BytesIO(img_bytes)).convert("RGB"))
+    present, absent, unrecognized_count, avg_conf, _, _, unrecognized_faces, _ = _fr.recognize_faces(img_np)
+    # Cache only what main() uses; the decoded frame and box lists would dominate each entry
+    return present, absent, unrecognized_count, avg_conf, unrecognized_faces
+
+@st.cache_data(ttl=60, show_spinner=False)
+def model_is_stale(_fr, data_dir, model_version):
+    # The walk stats every student folder; the version key re-checks right after training or a sync,
+    # and the ttl picks up photos copied into the folder by hand
+    return _fr.is_stale(data_dir)
+
 @st.cache_resource
 def init_system():
     fr = FaceRecognitionSystem()
     try:
         fr.load_model()
-        if not fr.known_encodings:
+        if len(fr.known_encodings) == 0 or (os.path.exists("student") and fr.is_stale("student")):
             st.session_state.needs_training = True
     except Exception as e:
         st.error(f"Failed to load model: {str(e)}")
     return fr
 
+@st.cache_data(max_entries=512, show_spinner=False)
+def _thumb(path, mtime):
+    # mtime is part of the key so a replaced photo is decoded again
+    with Image.open(path) as img:
+        img.thumbnail((100, 100))
+        buf = io.BytesIO()
+        img.convert('RGB').save(buf, format='JPEG')
+    return buf.getvalue()
+
 def get_student_image(fr, roll_no):
-    for student in fr.known_metadata:
-        if student['roll_no'] == roll_no:
-            try:
-                img = Image.open(student['image_path'])
-                img.thumbnail((100, 100))
-                return img
-            except:
-                return None
-    return None
+    student = fr.find_student(roll_no)
+    if student is None:
+        return None
+    try:
+        path = student['image_path']
+        return _thumb(path, os.path.getmtime(path))
+    except:
+        return None
 
-def display_student_card(fr, roll_no, name, status, confidence=None):
-    col1, col2 = st.columns([1, 4])
-    with col1:
-        student_img = get_student_image(fr, roll_no)
-        if student_img:
-            st.image(student_img, width=60)
-        else:
-            st.image(Image.new('RGB', (60, 60), color='gray'), width=60)
-    
-    with col2:
+@st.cache_data(show_spinner=False)
+def _placeholder_thumb():
+    buf = io.BytesIO()
+    Image.new('RGB', (60, 60), color='gray').save(buf, format='JPEG')
+    return buf.getvalue()
+
+def _table_cell(text):
+    # Names come from folder names; keep them from breaking the HTML or the table
+    return html.escape(str(text)).replace("|", "&#124;")
+
+def display_student_table(fr, students):
+    """Render (roll_no, name, status, confidence) rows as a single markdown table"""
+    rows = ["| Photo | Roll No | Name | Status |", "| --- | --- | --- | --- |"]
+    for roll_no, name, status, confidence in students:
+        thumb = base64.b64encode(get_student_image(fr, roll_no) or _placeholder_thumb()).decode()
         if status == "present":
-            st.markdown(f"**{roll_no}** - {name}  \n✅ Present ({confidence:.1%} confidence)" if confidence else f"**{roll_no}** - {name}  \n✅ Present")
+            status_text = f"✅ Present ({confidence:.1%} confidence)" if confidence else "✅ Present"
         else:
-            st.markdown(f"**{roll_no}** - {name}  \n❌ Absent")
+            status_text = "❌ Absent"
+        rows.append(
+            f'| <img src="data:image/jpeg;base64,{thumb}" width="60"> '
+            f"| **{_table_cell(roll_no)}** | {_table_cell(name)} | {status_text} |"
+        )
+    st.markdown("\n".join(rows), unsafe_allow_html=True)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _drive_folder_ids(_drive, parent_id):
+    return {folder['name']: folder['id'] for folder in _drive.list_folders(parent_id)}
 
 def create_student_folder(class_name, roll_no, student_name, photo_files, drive=None, drive_folder_id=None):
     class_folder = os.path.join("student", f"Class_{class_name}")
     student_folder = os.path.join(class_folder, f"{roll_no}_{student_name}")
     
-    if os.path.exists(student_folder):
-        shutil.rmtree(student_folder)
-    
+    # Photos are overwritten in place; only trim numbered leftovers from a larger earlier set
     os.makedirs(student_folder, exist_ok=True)
+    for i in range(len(photo_files) + 1, 5):
+        stale_path = os.path.join(student_folder, f"photo_{i}.jpg")
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
     
     saved_paths = []
     for i, photo_file in enumerate(photo_files, 1):
         photo_path = os.path.join(student_folder, f"photo_{i}.jpg")
-        with open(photo_path, "wb") as f:
-            f.write(photo_file.getbuffer())
+        tmp_path = photo_path + ".tmp"
+        # Stream in 1 MiB chunks and swap the file in atomically
+        photo_file.seek(0)
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(photo_file, f, 1 << 20)
+        os.replace(tmp_path, photo_path)
         saved_paths.append(photo_path)
     
     if drive and drive_folder_id:
         try:
-            class_folders = drive.list_folders(drive_folder_id)
-            class_folder_id = None
-            
-            for folder in class_folders:
-                if folder['name'] == f"Class_{class_name}":
-                    class_folder_id = folder['id']
-                    break
+            class_folder_name = f"Class_{class_name}"
+            class_folder_id = _drive_folder_ids(drive, drive_folder_id).get(class_folder_name)
             
             if not class_folder_id:
-                class_folder_id = drive.create_folder(f"Class_{class_name}", drive_folder_id)
+                class_folder_id = drive.create_folder(class_folder_name, drive_folder_id)
+                _drive_folder_ids.clear()
             
-            student_folders = drive.list_folders(class_folder_id)
-            student_folder_id = None
-            
-            for folder in student_folders:
-                if folder['name'] == f"{roll_no}_{student_name}":
-                    student_folder_id = folder['id']
-                    break
+            student_folder_name = f"{roll_no}_{student_name}"
+            student_folder_id = _drive_folder_ids(drive, class_folder_id).get(student_folder_name)
             
             if not student_folder_id:
-                student_folder_id = drive.create_folder(f"{roll_no}_{student_name}", class_folder_id)
+                student_folder_id = drive.create_folder(student_folder_name, class_folder_id)
+                _drive_folder_ids.clear()
             
-            for photo_path in saved_paths:
-                drive.upload_file(photo_path, student_folder_id)
+            # Uploads are independent and network-bound, so overlap them
+            with ThreadPoolExecutor(max_workers=min(4, len(saved_paths))) as executor:
+                list(executor.map(lambda path: drive.upload_file(path, student_folder_id), saved_paths))
             
             return saved_paths[0]
         except Exception as e:
@@ -429,38 +632,71 @@ def generate_report(present, absent, unrecognized_count, avg_conf):
         f"Attendance Report - {datetime.datetime.now():%Y-%m-%d %H:%M}",
         f"Present: {len(present)} | Absent: {len(absent)} | Unrecognized: {unrecognized_count}",
         f"Average Confidence: {avg_conf:.1%}",
-        "\nPRESENT STUDENTS:"
+        "",
+        "PRESENT STUDENTS:",
+        *[f"- {roll}: {name} ({conf:.1%})" for (roll, name), conf in sorted(present.items())],
+        "",
+        "ABSENT STUDENTS:",
+        *[f"- {roll}: {name}" for roll, name in sorted(absent)]
     ]
-    report.extend(f"- {roll}: {name} ({conf:.1%})" for (roll, name), conf in sorted(present.items()))
-    report.append("\nABSENT STUDENTS:")
-    report.extend(f"- {roll}: {name}" for roll, name in sorted(absent))
     return "\n".join(report)
 
+def _load_more_history():
+    page = get_sql_manager().get_attendance_history(30, HISTORY_PAGE_SIZE, len(st.session_state.history_rows))
+    st.session_state.history_rows.extend(page)
+    st.session_state.history_has_more = len(page) == HISTORY_PAGE_SIZE
+
+def _hide_history():
+    st.session_state.show_history = False
+    st.session_state.history_rows = None
+
+def _format_history_date(value):
+    # SQLite hands DATETIME columns back as ISO strings; SQL Server returns datetimes
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return f"{value:%Y-%m-%d %H:%M}"
+
 def display_attendance_history():
     if st.session_state.get('sql_enabled', False):
         if st.button("📊 View Attendance History"):
-            sql_manager = SQLServerManager()
+            # Start again from the newest page on every explicit view
+            st.session_state.history_rows = None
+            st.session_state.show_history = True
+        
+        if st.session_state.get('show_history', False):
+            sql_manager = get_sql_manager()
             
-            if sql_manager.connect():
-                history = sql_manager.get_attendance_history(30)
+            if sql_manager.connection:
+                if st.session_state.get('history_rows') is None:
+                    st.session_state.history_rows = sql_manager.get_attendance_history(30, HISTORY_PAGE_SIZE)
+                    st.session_state.history_has_more = len(st.session_state.history_rows) == HISTORY_PAGE_SIZE
+                history = st.session_state.history_rows
                 
                 st.subheader("Attendance History (Last 30 days)")
+                st.button("Hide history", on_click=_hide_history)
                 
                 if not history:
                     st.info("No attendance records found in the database.")
                 else:
                     for record in history:
-                        with st.expander(f"{record[2]:%Y-%m-%d %H:%M} - {record[1]} - Present: {record[3]}"):
+                        with st.expander(f"{_format_history_date(record[2])} - {record[1]} - Present: {record[3]}"):
                             st.write(f"**Class:** {record[1]}")
                             st.write(f"**Date:** {record[2]}")
                             st.write(f"**Present:** {record[3]}")
                             st.write(f"**Absent:** {record[4]}")
                             st.write(f"**Unrecognized:** {record[5]}")
                             st.write(f"**Avg Confidence:** {record[6]:.1%}")
-                sql_manager.close()
+                    
+                    if st.session_state.history_has_more:
+                        st.button("Load more", on_click=_load_more_history)
             else:
                 st.error("❌ Database connection failed")
+                get_sql_manager.clear()
 
+@st.fragment
 def display_attendance_results(fr, attendance_data, is_updated=False):
     present = attendance_data['present']
     absent = attendance_data['absent']
@@ -482,15 +718,13 @@ def display_attendance_results(fr, attendance_data, is_updated=False):
     
     with st.expander(f"Present Students ({len(present)})", expanded=True):
         if present:
-            for (roll, name), conf in sorted(present.items()):
-                display_student_card(fr, roll, name, "present", conf)
+            display_student_table(fr, [(roll, name, "present", conf) for (roll, name), conf in sorted(present.items())])
         else:
             st.info("No recognized students")
     
     with st.expander(f"Absent Students ({len(absent)})"):
         if absent:
-            for roll, name in sorted(absent):
-                display_student_card(fr, roll, name, "absent")
+            display_student_table(fr, [(roll, name, "absent", None) for roll, name in sorted(absent)])
         else:
             st.info("All students present!")
     
@@ -499,25 +733,23 @@ def display_attendance_results(fr, attendance_data, is_updated=False):
             st.warning(f"{unrecognized_count} faces couldn't be identified")
             
             cols = st.columns(3)
-            for i, face_img in enumerate(attendance_data['unrecognized_faces']):
-                with cols[i % 3]:
-                    st.image(face_img, caption=f"Unrecognized Face {i+1}", use_container_width=True)
+            # Faces are keyed by a stable id so removing one never shifts or copies the rest
+            for slot, (face_id, face_img) in enumerate(list(attendance_data['unrecognized_faces'].items())):
+                with cols[slot % 3]:
+                    st.image(face_img, caption=f"Unrecognized Face {face_id+1}", use_container_width=True)
                     
-                    with st.form(key=f"reupload_form_{i}_{st.session_state.form_key}"):
+                    with st.form(key=f"reupload_form_{face_id}_{st.session_state.form_key}"):
                         reuploaded = st.file_uploader(
-                            f"Reupload better photo for Face {i+1}",
+                            f"Reupload better photo for Face {face_id+1}",
                             type=["jpg", "jpeg", "png"],
-                            key=f"reupload_{i}_{st.session_state.form_key}"
+                            key=f"reupload_{face_id}_{st.session_state.form_key}"
                         )
                         
-                        if st.form_submit_button(f"Update Recognition for Face {i+1}"):
+                        if st.form_submit_button(f"Update Recognition for Face {face_id+1}"):
                             if reuploaded:
                                 try:
-                                    reupload_img = Image.open(reuploaded)
-                                    reupload_np = np.array(reupload_img)
-                                    
-                                    if reupload_np.shape[2] == 4:
-                                        reupload_np = reupload_np[..., :3]
+                                    # convert() drops alpha/palette and yields a contiguous RGB array
+                                    reupload_np = np.asarray(Image.open(reuploaded).convert("RGB"))
                                     
                                     recognition_result = fr.recognize_single_face(reupload_np)
                                     
@@ -531,10 +763,8 @@ def display_attendance_results(fr, attendance_data, is_updated=False):
                                             attendance_data['absent'].remove((roll, name))
                                         
                                         # Remove from unrecognized faces
-                                        updated_faces = attendance_data['unrecognized_faces'].copy()
-                                        updated_faces.pop(i)
-                                        attendance_data['unrecognized_faces'] = updated_faces
-                                        attendance_data['unrecognized_count'] = len(updated_faces)
+                                        del attendance_data['unrecognized_faces'][face_id]
+                                        attendance_data['unrecognized_count'] = len(attendance_data['unrecognized_faces'])
                                         
                                         st.session_state.attendance_data = attendance_data
                                         st.session_state.form_key += 1
@@ -546,7 +776,7 @@ def display_attendance_results(fr, attendance_data, is_updated=False):
                             else:
                                 st.warning("Please upload a photo first")
                     
-                    if st.button(f"Add as New Student", key=f"add_face_{i}_{st.session_state.form_key}"):
+                    if st.button(f"Add as New Student", key=f"add_face_{face_id}_{st.session_state.form_key}"):
                         st.session_state.new_student_img = face_img
                         st.session_state.show_add_student = True
                         st.rerun()
@@ -581,15 +811,13 @@ def display_attendance_results(fr, attendance_data, is_updated=False):
                     st.write(f"Unrecognized: {unrecognized_count}")
                     st.write(f"Avg confidence: {avg_conf}")
                     
-                sql_manager = SQLServerManager()
+                sql_manager = get_sql_manager()
                 
-                if sql_manager.connect():
-                    # First create tables if they don't exist
-                    if sql_manager.create_tables():
-                        st.success("✅ Tables created/verified successfully")
-                    else:
+                if sql_manager.connection:
+                    # Tables are normally created once in get_sql_manager(); this only
+                    # retries if that failed
+                    if not sql_manager.create_tables():
                         st.error(f"❌ Failed to create tables: {sql_manager.last_error}")
-                        sql_manager.close()
                         return
                     
                     class_name = st.session_state.get('current_class', 'Default Class')
@@ -616,9 +844,63 @@ def display_attendance_results(fr, attendance_data, is_updated=False):
                         st.rerun()
                     else:
                         st.error(f"❌ Failed to save attendance: {sql_manager.last_error}")
-                    sql_manager.close()
                 else:
                     st.error("❌ Database connection failed")
+                    get_sql_manager.clear()
+
+@st.fragment
+def add_student_fragment():
+    with st.expander("➕ Add Students", expanded=False):
+        with st.form(key=f'add_student_form_{st.session_state.form_key}'):
+            class_name = st.text_input("Class Name", value=st.session_state.current_class, key=f"class_name_{st.session_state.form_key}")
+            roll_no = st.text_input("Roll Number", key=f"roll_no_{st.session_state.form_key}")
+            student_name = st.text_input("Student Name", key=f"student_name_{st.session_state.form_key}")
+            
+            photo_files = st.file_uploader(
+                "Upload Student Photos (up to 4, different angles)", 
+                type=["jpg", "jpeg", "png"], 
+                accept_multiple_files=True,
+                key=f"student_photos_{st.session_state.form_key}"
+            )
+            
+            if st.form_submit_button("Add Student"):
+                error = validate_student_inputs(class_name, roll_no, student_name, photo_files)
+                if error:
+                    st.error(error)
+                else:
+                    try:
+                        drive_instance = None
+                        drive_folder_id = None
+                        
+                        if st.session_state.get('drive_enabled', False) and drive_credentials_available():
+                            drive_instance = get_drive()
+                            drive_folder_id = st.session_state.get('smartattendancesystem-465906')
+                        
+                        first_photo_path = create_student_folder(
+                            class_name,
+                            roll_no,
+                            student_name,
+                            photo_files[:4],
+                            drive_instance,
+                            drive_folder_id
+                        )
+                        
+                        st.success(f"""
+                        ✅ Successfully added student:
+                        - Name: {student_name}
+                        - Roll: {roll_no}
+                        - Class: {class_name}
+                        - Photos uploaded: {len(photo_files)}
+                        """)
+                        
+                        if drive_instance and drive_folder_id:
+                            st.success("Student data successfully synced to Google Drive")
+                        
+                        st.session_state.form_key += 1
+                        st.rerun()
+                        
+                    except Exception as e:
+                        st.error(f"Error adding student: {str(e)}")
 
 def main():
     # Initialize session state
@@ -646,57 +928,7 @@ def main():
         # Add class selection
         st.session_state.current_class = st.text_input("Current Class", value=st.session_state.current_class)
         
-        with st.expander("➕ Add Students", expanded=False):
-            with st.form(key=f'add_student_form_{st.session_state.form_key}'):
-                class_name = st.text_input("Class Name", value=st.session_state.current_class, key=f"class_name_{st.session_state.form_key}")
-                roll_no = st.text_input("Roll Number", key=f"roll_no_{st.session_state.form_key}")
-                student_name = st.text_input("Student Name", key=f"student_name_{st.session_state.form_key}")
-                
-                photo_files = st.file_uploader(
-                    "Upload Student Photos (up to 4, different angles)", 
-                    type=["jpg", "jpeg", "png"], 
-                    accept_multiple_files=True,
-                    key=f"student_photos_{st.session_state.form_key}"
-                )
-                
-                if st.form_submit_button("Add Student"):
-                    error = validate_student_inputs(class_name, roll_no, student_name, photo_files)
-                    if error:
-                        st.error(error)
-                    else:
-                        try:
-                            drive_instance = None
-                            drive_folder_id = None
-                            
-                            if st.session_state.get('drive_enabled', False) and os.path.exists('C:/smart-attendance-system/credentials/smartattendancesystem-465906-1d185d330be1.json'):
-                                drive_instance = GoogleDriveManager('C:/smart-attendance-system/credentials/smartattendancesystem-465906-1d185d330be1.json')
-                                drive_folder_id = st.session_state.get('smartattendancesystem-465906')
-                            
-                            first_photo_path = create_student_folder(
-                                class_name,
-                                roll_no,
-                                student_name,
-                                photo_files[:4],
-                                drive_instance,
-                                drive_folder_id
-                            )
-                            
-                            st.success(f"""
-                            ✅ Successfully added student:
-                            - Name: {student_name}
-                            - Roll: {roll_no}
-                            - Class: {class_name}
-                            - Photos uploaded: {len(photo_files)}
-                            """)
-                            
-                            if drive_instance and drive_folder_id:
-                                st.success("Student data successfully synced to Google Drive")
-                            
-                            st.session_state.form_key += 1
-                            st.rerun()
-                            
-                        except Exception as e:
-                            st.error(f"Error adding student: {str(e)}")
+        add_student_fragment()
 
         if st.button("🔄 Train Model", disabled=not os.path.exists("student")):
             with st.spinner("Training..."):
@@ -710,14 +942,16 @@ def main():
         
         if not os.path.exists("student"):
             st.warning("Create 'student' folder with photos")
+        elif model_is_stale(fr, "student", fr.version):
+            st.info("Student photos changed since the last training. Retrain to include them.")
         
         st.divider()
         st.subheader("Google Drive Sync")
         
         drive_enabled = st.toggle("Enable Google Drive", key="drive_enabled")
         if drive_enabled:
-            if os.path.exists('C:/smart-attendance-system/credentials/smartattendancesystem-465906-1d185d330be1.json'):
-                drive = GoogleDriveManager('C:/smart-attendance-system/credentials/smartattendancesystem-465906-1d185d330be1.json')
+            if drive_credentials_available():
+                drive = get_drive()
                 drive_folder_id = st.text_input("Drive Folder ID", key="smartattendancesystem-465906")
                 
                 if st.button("⬇️ Sync from Drive"):
@@ -791,6 +1025,8 @@ def main():
                             st.error(message)
                     else:
                         # Test Windows Authentication
+                        # An explicit test should really probe, not replay the remembered server
+                        _remembered_server.clear()
                         sql_manager = SQLServerManager(server_to_try, sql_database)
                         if sql_manager.connect():
                             st.success("✅ Connection successful!")
@@ -822,7 +1058,7 @@ def main():
         """, unsafe_allow_html=True)
         return
     
-    if not fr.known_encodings:
+    if len(fr.known_encodings) == 0:
         st.info("### Training Required")
         st.markdown("""
         <div style="background-color:#e6f3ff;padding:20px;border-radius:10px">
@@ -845,29 +1081,32 @@ def main():
     if uploaded_file:
         st.session_state.original_upload = uploaded_file
         try:
-            img = Image.open(uploaded_file)
-            img_np = np.array(img)
-            
-            if img_np.shape[2] == 4:
-                img_np = img_np[..., :3]
+            # One contiguous RGB uint8 copy; also covers grayscale and palette uploads
+            img_np = np.asarray(Image.open(uploaded_file).convert("RGB"))
             
             col1, col2 = st.columns([1, 2])
             with col1:
                 st.image(img_np, caption="Uploaded Photo", use_container_width=True)
             
             with col2:
-                with st.spinner("Recognizing faces..."):
-                    present, absent, unrecognized_count, avg_conf, _, _, unrecognized_faces, _ = fr.recognize_faces(img_np)
-                    
-                    st.session_state.attendance_data = {
-                        'present': dict(present),
-                        'absent': list(absent),
-                        'unrecognized_count': unrecognized_count,
-                        'avg_conf': avg_conf,
-                        'unrecognized_faces': unrecognized_faces
-                    }
-                    
-                    display_attendance_results(fr, st.session_state.attendance_data)
+                future = get_recognition_executor().submit(recognize_cached, fr, uploaded_file.getvalue(), fr.version)
+                status = st.empty()
+                started = time.monotonic()
+                while not future.done():
+                    status.info(f"Recognizing faces... {time.monotonic() - started:.1f}s")
+                    time.sleep(0.2)
+                status.empty()
+                present, absent, unrecognized_count, avg_conf, unrecognized_faces = future.result()
+                
+                st.session_state.attendance_data = {
+                    'present': dict(present),
+                    'absent': list(absent),
+                    'unrecognized_count': unrecognized_count,
+                    'avg_conf': avg_conf,
+                    'unrecognized_faces': dict(enumerate(unrecognized_faces))
+                }
+                
+                display_attendance_results(fr, st.session_state.attendance_data)
 
         except Exception as e:
             st.error(f"Error: {str(e)}")
@@ -884,28 +1123,29 @@ def main():
                 
                 if st.form_submit_button("Add Student"):
                     try:
-                        temp_path = "temp_face.jpg"
-                        Image.fromarray(st.session_state.new_student_img).save(temp_path)
+                        ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(st.session_state.new_student_img, cv2.COLOR_RGB2BGR),
+                                                   [cv2.IMWRITE_JPEG_QUALITY, 92])
+                        if not ok:
+                            raise ValueError("Could not encode face image")
                         
                         drive_instance = None
                         drive_folder_id = None
                         
-                        if st.session_state.get('drive_enabled', False) and os.path.exists('C:/smart-attendance-system/credentials/smartattendancesystem-465906-1d185d330be1.json'):
-                            drive_instance = GoogleDriveManager('C:/smart-attendance-system/credentials/smartattendancesystem-465906-1d185d330be1.json')
+                        if st.session_state.get('drive_enabled', False) and drive_credentials_available():
+                            drive_instance = get_drive()
                             drive_folder_id = st.session_state.get('smartattendancesystem-465906')
                         
                         first_photo_path = create_student_folder(
                             class_name,
                             roll_no,
                             student_name,
-                            [open(temp_path, "rb")],
+                            [io.BytesIO(encoded.tobytes())],
                             drive_instance,
                             drive_folder_id
                         )
                         
                         st.success(f"Added new student: {student_name} (Roll: {roll_no})")
                         st.session_state.show_add_student = False
-                        os.remove(temp_path)
                         
                         with st.spinner("Retraining model with new student..."):
                             fr.train_model("student")
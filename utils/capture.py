@@ -1,8 +1,50 @@
 import cv2
 import os
 import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+class FrameGrabber(threading.Thread):
+    """
+    Reads the camera on a background thread and keeps only the latest frame,
+    so the preview never falls behind the driver's buffer
+    :param src: Camera index passed to cv2.VideoCapture
+    """
+    def __init__(self, src=0):
+        super().__init__(daemon=True)
+        self.cap = cv2.VideoCapture(src)
+        # MJPG decodes much faster than YUYV on most webcams
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._running = True
+        self._ok = False
+        self._frame = None
+
+    def run(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            with self._lock:
+                self._ok, self._frame = ret, frame
+            self._ready.set()
+            if not ret:
+                break
+
+    def read(self):
+        """Return (ok, copy of the most recent frame)"""
+        self._ready.wait(timeout=5)
+        with self._lock:
+            if not self._ok or self._frame is None:
+                return False, None
+            return True, self._frame.copy()
+
+    def stop(self):
+        self._running = False
+        self.join(timeout=1)
+        self.cap.release()
+
 def capture_student_images(student_name, roll_no, num_angles=5):
     """
     Captures multiple angles of a student's face
@@ -10,7 +52,10 @@ def capture_student_images(student_name, roll_no, num_angles=5):
     :param roll_no: Roll number of the student
     :param num_angles: Number of angles to capture (default 5)
     """
-    cap = cv2.VideoCapture(0)
+    grabber = FrameGrabber(0)
+    grabber.start()
+    # JPEG encoding releases the GIL, so saves run off the preview loop
+    writer = ThreadPoolExecutor(max_workers=2)
     base_dir = "../student_data"
     os.makedirs(base_dir, exist_ok=True)
     
@@ -19,36 +64,39 @@ def capture_student_images(student_name, roll_no, num_angles=5):
     
     angle_count = 0
     while angle_count < num_angles:
-        ret, frame = cap.read()
+        ret, frame = grabber.read()
         if not ret:
             print("Failed to capture image")
             break
             
-        # Display instructions on the frame
+        # Display instructions on a copy so the saved photo stays clean
+        preview = frame.copy()
         instructions = f"Angle {angle_count+1}/{num_angles} - Press 's' to capture"
-        cv2.putText(frame, instructions, (10, 30), 
+        cv2.putText(preview, instructions, (10, 30), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         
-        cv2.imshow('Student Capture', frame)
+        cv2.imshow('Student Capture', preview)
         
         key = cv2.waitKey(1)
         if key == ord('s'):
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             img_name = f"{base_dir}/{roll_no}_{student_name}_{timestamp}_{uuid.uuid4().hex[:6]}.jpg"
-            cv2.imwrite(img_name, frame)
-            print(f"Saved: {img_name}")
+            # grabber.read() already handed us a private copy of the frame
+            writer.submit(cv2.imwrite, img_name, frame, [cv2.IMWRITE_JPEG_QUALITY, 92])
+            print(f"Saving: {img_name}")
             angle_count += 1
             
             # Show confirmation
-            cv2.putText(frame, "CAPTURED!", (50, 150), 
+            cv2.putText(preview, "CAPTURED!", (50, 150), 
                        cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3)
-            cv2.imshow('Student Capture', frame)
+            cv2.imshow('Student Capture', preview)
             cv2.waitKey(500)
             
         elif key == ord('q'):
             break
     
-    cap.release()
+    grabber.stop()
+    writer.shutdown(wait=True)
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
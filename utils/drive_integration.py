@@ -1,10 +1,25 @@
 
 import os
 import io
+import threading
+import httplib2
+import google_auth_httplib2
+from concurrent.futures import ThreadPoolExecutor
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+# Concurrent transfers; Drive throttles a single user at roughly ten writes a second
+DRIVE_WORKERS = 8
+# Retries with exponential backoff on 429/5xx and rateLimitExceeded responses
+DRIVE_RETRIES = 5
+# Files at or below this size go up in one multipart request instead of a resumable session
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+# Bytes per request for resumable uploads and chunked downloads
+TRANSFER_CHUNKSIZE = 16 * 1024 * 1024
+# Drive rejects batches with more than 100 calls
+BATCH_LIMIT = 100
 
 class GoogleDriveManager:
     def __init__(self, credentials_path: str):
@@ -15,7 +30,17 @@ class GoogleDriveManager:
         self.SCOPES = ['https://www.googleapis.com/auth/drive']
         self.credentials = service_account.Credentials.from_service_account_file(
             credentials_path, scopes=self.SCOPES)
-        self.service = build('drive', 'v3', credentials=self.credentials)
+        # The bundled discovery document is enough; skip the file-cache lookup and its warnings
+        self.service = build('drive', 'v3', credentials=self.credentials, cache_discovery=False)
+        self._local = threading.local()
+    
+    def _http(self):
+        """Per-thread authorized transport; httplib2 is not thread-safe"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+            self._local.http = http
+        return http
     
     def create_folder(self, folder_name: str, parent_id: str = None) -> str:
         """Create a folder in Google Drive"""
@@ -29,7 +54,7 @@ class GoogleDriveManager:
         folder = self.service.files().create(
             body=folder_metadata,
             fields='id'
-        ).execute()
+        ).execute(http=self._http())
         return folder.get('id')
     
     def upload_file(self, file_path: str, folder_id: str = None) -> str:
@@ -42,61 +67,100 @@ class GoogleDriveManager:
         if folder_id:
             file_metadata['parents'] = [folder_id]
         
-        media = MediaFileUpload(file_path, resumable=True)
+        media = MediaFileUpload(file_path, chunksize=TRANSFER_CHUNKSIZE,
+                                resumable=os.path.getsize(file_path) > RESUMABLE_THRESHOLD)
         file = self.service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id'
-        ).execute()
+        ).execute(http=self._http(), num_retries=DRIVE_RETRIES)
         return file.get('id')
     
     def download_file(self, file_id: str, save_path: str) -> None:
         """Download a file from Google Drive"""
         request = self.service.files().get_media(fileId=file_id)
-        fh = io.FileIO(save_path, 'wb')
-        downloader = MediaIoBaseDownload(fh, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            print(f"Download {int(status.progress() * 100)}%")
+        request.http = self._http()
+        with io.FileIO(save_path, 'wb') as fh:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=TRANSFER_CHUNKSIZE)
+            
+            done = False
+            while not done:
+                _, done = downloader.next_chunk(num_retries=DRIVE_RETRIES)
+    
+    def _list_all(self, query: str, fields: str) -> List[Dict]:
+        """Follow nextPageToken until every match has been fetched"""
+        files, page_token = [], None
+        while True:
+            results = self.service.files().list(
+                q=query,
+                pageSize=1000,
+                pageToken=page_token,
+                fields=f"nextPageToken, files({fields})"
+            ).execute(http=self._http())
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return files
     
     def list_files(self, folder_id: str = None) -> List[Dict]:
         """List all files in a folder"""
-        query = f"'{folder_id}' in parents" if folder_id else None
-        results = self.service.files().list(
-            q=query,
-            pageSize=100,
-            fields="files(id, name, mimeType)"
-        ).execute()
-        return results.get('files', [])
+        query = f"'{folder_id}' in parents and trashed = false" if folder_id else "trashed = false"
+        return self._list_all(query, "id, name, mimeType")
     
-    def find_file_by_name(self, name: str, folder_id: str = None) -> Optional[str]:
-        """Find a file by name and return its ID"""
-        query = f"name = '{name}'"
+    @staticmethod
+    def _name_query(name: str, folder_id: str = None) -> str:
+        query = f"name = '{name}' and trashed = false"
         if folder_id:
             query += f" and '{folder_id}' in parents"
-        
+        return query
+    
+    def find_file_by_name(self, name: str, folder_id: str = None) -> Optional[str]:
+        """Find a file by name and return its ID"""
         results = self.service.files().list(
-            q=query,
+            q=self._name_query(name, folder_id),
             pageSize=1,
             fields="files(id)"
-        ).execute()
+        ).execute(http=self._http())
         files = results.get('files', [])
         return files[0]['id'] if files else None
     
+    def find_files_by_name_batch(self, names: List[str], folder_id: str = None) -> Dict[str, Optional[str]]:
+        """
+        Look up several files by name with batched metadata requests
+        :param names: File names to find
+        :param folder_id: Only match files directly inside this folder
+        :return: Mapping of every name to its file ID, or None when not found
+        """
+        names = list(dict.fromkeys(names))
+        file_ids = dict.fromkeys(names)
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                raise exception
+            files = response.get('files', [])
+            file_ids[names[int(request_id)]] = files[0]['id'] if files else None
+        
+        for start in range(0, len(names), BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            # Indexes, not names, as request IDs: names may contain characters the batch boundary rejects
+            for i in range(start, min(start + BATCH_LIMIT, len(names))):
+                batch.add(self.service.files().list(
+                    q=self._name_query(names[i], folder_id),
+                    pageSize=1,
+                    fields="files(id)"
+                ), request_id=str(i))
+            batch.execute(http=self._http())
+        return file_ids
+    
     def list_folders(self, parent_folder_id: str) -> List[Dict]:
         """
         List all folders within a parent folder
         :param parent_folder_id: ID of the parent folder
         :return: List of folder dictionaries (id, name)
         """
-        query = f"'{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder'"
-        results = self.service.files().list(
-            q=query,
-            fields="files(id, name)"
-        ).execute()
-        return results.get('files', [])
+        query = (f"'{parent_folder_id}' in parents and "
+                 "mimeType = 'application/vnd.google-apps.folder' and trashed = false")
+        return self._list_all(query, "id, name")
     
     def create_folder_in_parent(self, folder_name: str, parent_folder_id: str) -> str:
         """
@@ -113,9 +177,52 @@ class GoogleDriveManager:
         folder = self.service.files().create(
             body=file_metadata,
             fields='id'
-        ).execute()
+        ).execute(http=self._http())
         return folder.get('id')
     
+    def create_folders_batch(self, folder_names: List[str], parent_folder_id: str) -> Dict[str, str]:
+        """
+        Create several sibling folders with batched metadata requests
+        :param folder_names: Names of the folders to create
+        :param parent_folder_id: ID of the parent folder
+        :return: Mapping of folder name to new folder ID
+        """
+        folder_ids = {}
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                raise exception
+            folder_ids[request_id] = response.get('id')
+        
+        for start in range(0, len(folder_names), BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for name in folder_names[start:start + BATCH_LIMIT]:
+                batch.add(self.service.files().create(
+                    body={
+                        'name': name,
+                        'mimeType': 'application/vnd.google-apps.folder',
+                        'parents': [parent_folder_id]
+                    },
+                    fields='id'
+                ), request_id=name)
+            batch.execute(http=self._http())
+        return folder_ids
+    
+    def _collect_uploads(self, local_folder_path: str, folder_id: str, jobs: List[Tuple[str, str]]) -> None:
+        # Folders are created up front since children need their parent's ID
+        subfolders = []
+        for item in os.listdir(local_folder_path):
+            item_path = os.path.join(local_folder_path, item)
+            if os.path.isdir(item_path):
+                subfolders.append(item)
+            else:
+                jobs.append((item_path, folder_id))
+        
+        if subfolders:
+            subfolder_ids = self.create_folders_batch(subfolders, folder_id)
+            for item in subfolders:
+                self._collect_uploads(os.path.join(local_folder_path, item), subfolder_ids[item], jobs)
+    
     def upload_folder(self, local_folder_path: str, parent_folder_id: str = None) -> List[str]:
         """
         Upload an entire folder to Google Drive
@@ -126,15 +233,20 @@ class GoogleDriveManager:
         folder_name = os.path.basename(local_folder_path)
         folder_id = self.create_folder_in_parent(folder_name, parent_folder_id) if parent_folder_id else self.create_folder(folder_name)
         
-        uploaded_ids = []
-        for item in os.listdir(local_folder_path):
-            item_path = os.path.join(local_folder_path, item)
-            if os.path.isdir(item_path):
-                uploaded_ids.extend(self.upload_folder(item_path, folder_id))
-            else:
-                uploaded_ids.append(self.upload_file(item_path, folder_id))
+        jobs = []
+        self._collect_uploads(local_folder_path, folder_id, jobs)
         
-        return uploaded_ids
+        with ThreadPoolExecutor(max_workers=DRIVE_WORKERS) as executor:
+            return list(executor.map(lambda job: self.upload_file(*job), jobs))
+    
+    def _collect_downloads(self, folder_id: str, local_path: str, jobs: List[Tuple[str, str]]) -> None:
+        os.makedirs(local_path, exist_ok=True)
+        for item in self.list_files(folder_id):
+            item_path = os.path.join(local_path, item['name'])
+            if item['mimeType'] == 'application/vnd.google-apps.folder':
+                self._collect_downloads(item['id'], item_path, jobs)
+            else:
+                jobs.append((item['id'], item_path))
     
     def download_folder(self, folder_id: str, local_path: str) -> None:
         """
@@ -142,12 +254,9 @@ class GoogleDriveManager:
         :param folder_id: ID of the folder to download
         :param local_path: Local path to save the folder
         """
-        os.makedirs(local_path, exist_ok=True)
-        items = self.list_files(folder_id)
+        jobs = []
+        self._collect_downloads(folder_id, local_path, jobs)
         
-        for item in items:
-            item_path = os.path.join(local_path, item['name'])
-            if item['mimeType'] == 'application/vnd.google-apps.folder':
-                self.download_folder(item['id'], item_path)
-            else:
-                self.download_file(item['id'], item_path)
\ No newline at end of file
+        with ThreadPoolExecutor(max_workers=DRIVE_WORKERS) as executor:
+            # Consume the results so worker exceptions propagate
+            list(executor.map(lambda job: self.download_file(*job), jobs))
@@ -1,14 +1,26 @@
 
-from utils.drive_integration import GoogleDriveManager
+from utils.drive_integration import GoogleDriveManager, DRIVE_WORKERS
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import os
 
+CREDENTIALS_PATH = r'C:\smart-attendance-system\credentials\smartattendancesystem-465906-1d185d330be1.json'
+
+@lru_cache(maxsize=None)
+def get_drive(credentials_path: str = CREDENTIALS_PATH) -> GoogleDriveManager:
+    return GoogleDriveManager(credentials_path)
+
 def upload_student_photos(local_dir: str, drive_folder_id: str):
-    drive = GoogleDriveManager('C:\smart-attendance-system\credentials\smartattendancesystem-465906-1d185d330be1.json')
-    for filename in os.listdir(local_dir):
-        if filename.endswith(('.jpg', '.jpeg', '.png')):
-            file_path = os.path.join(local_dir, filename)
-            drive.upload_file(file_path, drive_folder_id)
-            print(f"Uploaded: {filename}")
+    drive = get_drive()
+    filenames = [f for f in os.listdir(local_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+
+    def upload(filename):
+        drive.upload_file(os.path.join(local_dir, filename), drive_folder_id)
+        print(f"Uploaded: {filename}")
+
+    # Uploads are independent and network-bound; upload_file retries throttled requests itself
+    with ThreadPoolExecutor(max_workers=DRIVE_WORKERS) as executor:
+        list(executor.map(upload, filenames))
 
 # Run this once to upload existing photos
-# upload_student_photos("local_student_photos", "DRIVE_FOLDER_ID")
\ No newline at end of file
+# upload_student_photos("local_student_photos", "DRIVE_FOLDER_ID")
@@ -1,72 +1,178 @@
 
 import face_recognition
+import dlib
 import os
+import hashlib
+import multiprocessing
 import pickle
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
 import cv2
 import numpy as np
 from typing import List, Dict, Tuple, Optional, Union
-from PIL import Image
-from joblib import Parallel, delayed
+from concurrent.futures import ProcessPoolExecutor
 import warnings
-import gc
+from utils.match import prepare_gallery, squared_norms, nearest, build_ann, ann_nearest
 
 # Suppress unnecessary warnings
 warnings.filterwarnings("ignore")
 
+# Training images per batched descriptor call
+ENCODE_BATCH_SIZE = 16
+
+# Longest edge face detection runs at; encoding still uses full resolution
+DETECT_MAX_EDGE = 1024
+
+# Faces the training encoder groups per descriptor call while detection keeps running
+PIPELINE_ENCODE_BATCH = 8
+# How long the encoder waits for more faces before flushing a partial group
+PIPELINE_FLUSH_SECONDS = 0.05
+
+# Thread-count knobs numpy, OpenCV and dlib read once, when they are first loaded
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+# os.environ is process-wide; overlapping trainings would restore each other's pinned values
+_thread_env_lock = threading.Lock()
+
+# Decoded training thumbnails, reused by later training runs while the photo is unchanged
+THUMB_CACHE_DIR = os.path.join(".cache", "thumbs")
+# Entries kept after a training run, least recently used dropped first
+THUMB_CACHE_MAX_ENTRIES = 4096
+# Temp files older than this belong to a crashed write, not one still in flight
+THUMB_TMP_MAX_AGE = 3600
+
+def _face_shapes(image: np.ndarray, locations: List[Tuple[int, int, int, int]]):
+    # Same 5-point landmarks face_recognition.face_encodings uses by default
+    shapes = dlib.full_object_detections()
+    shapes.extend(face_recognition.api._raw_face_landmarks(image, locations, model="small"))
+    return shapes
+
+def _encode_faces(image: np.ndarray, locations: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+    """Encode every face in one image with a single descriptor-network call"""
+    if not locations:
+        return []
+    descriptors = face_recognition.api.face_encoder.compute_face_descriptor(image, _face_shapes(image, locations), 1)
+    return [np.array(d) for d in descriptors]
+
+def _encode_image_batch(images: List[np.ndarray], locations: List[List[Tuple[int, int, int, int]]]) -> List[List[np.ndarray]]:
+    """Encode faces across several images with one descriptor-network call"""
+    if not images:
+        return []
+    shapes = [_face_shapes(image, locs) for image, locs in zip(images, locations)]
+    descriptors = face_recognition.api.face_encoder.compute_face_descriptor(images, shapes, 1)
+    return [[np.array(d) for d in per_image] for per_image in descriptors]
+
 class FaceRecognitionSystem:
     def __init__(self, model_path=r"C:\smart-attendance-system\models\face_encodings.pkl"):
         self.known_encodings = []
         self.known_metadata = []
+        self._roll_index = {}
+        # Bumped whenever the gallery changes so callers can key caches on it
+        self.version = 0
+        self._gallery = prepare_gallery([])
+        self._gallery_sqnorm = squared_norms(self._gallery)
+        self._ann = None
+        # Distinct (roll_no, name) keys and the key index of every gallery row
+        self._students = []
+        self._student_ids = np.zeros(0, dtype=np.intp)
+        self._all_students = frozenset()
         self.model_path = model_path
+        # Guards swapping in a new gallery: training and lazy loads run from different sessions
+        self._model_lock = threading.RLock()
         os.makedirs(os.path.dirname(model_path), exist_ok=True)
 
-    def _fast_load_image(self, img_path: Union[str, np.ndarray], max_size: int = 400) -> np.ndarray:
+    def _build_indexes(self) -> None:
+        # First entry per roll number wins, matching the old linear scan
+        self._roll_index = {}
+        for student in self.known_metadata:
+            self._roll_index.setdefault(student['roll_no'], student)
+        self._gallery = prepare_gallery(self.known_encodings)
+        self._gallery_sqnorm = squared_norms(self._gallery)
+        self._ann = build_ann(self._gallery)
+        student_index = {}
+        self._student_ids = np.array([
+            student_index.setdefault((m['roll_no'], m['name']), len(student_index))
+            for m in self.known_metadata
+        ], dtype=np.intp)
+        self._students = list(student_index)
+        self._all_students = frozenset(self._students)
+        self.version += 1
+
+    def _nearest(self, encodings) -> Tuple[np.ndarray, np.ndarray]:
+        # Exact GEMM for class-sized galleries, HNSW once the gallery is large
+        if self._ann is not None:
+            return ann_nearest(encodings, self._ann)
+        return nearest(encodings, self._gallery, self._gallery_sqnorm)
+
+    def find_student(self, roll_no: str) -> Optional[Dict]:
+        return self._roll_index.get(roll_no)
+
+    @staticmethod
+    def _fast_load_image(img_path: Union[str, np.ndarray], max_size: int = 400) -> np.ndarray:
         if isinstance(img_path, np.ndarray):
-            return img_path
+            image = img_path
+            # Grayscale -> RGB and RGBA -> RGB so dlib always sees (H, W, 3)
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+            elif image.shape[-1] == 4:
+                image = image[..., :3]
+            # Already C-contiguous uint8 is passed through untouched; otherwise copy once
+            # here rather than inside every dlib call
+            return np.ascontiguousarray(image, dtype=np.uint8)
         try:
-            with Image.open(img_path) as img:
-                img.thumbnail((max_size, max_size))
-                return np.array(img)
+            # imdecode over np.fromfile also copes with non-ASCII Windows paths, unlike imread
+            img = cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError("unsupported or corrupt image")
+            h, w = img.shape[:2]
+            scale = max_size / max(h, w)
+            if scale < 1:
+                img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+            return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         except Exception as e:
             print(f"Failed to load {img_path}: {str(e)}")
             raise
 
-    def _optimized_face_locations(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    @staticmethod
+    def _optimized_face_locations(image: np.ndarray) -> List[Tuple[int, int, int, int]]:
         face_locations = face_recognition.face_locations(
             image, model="hog", number_of_times_to_upsample=1
         )
         
-        if not face_locations:
+        # The CNN detector is only worth it on a GPU; on CPU it is dozens of times slower than HOG
+        if not face_locations and dlib.DLIB_USE_CUDA:
             face_locations = face_recognition.face_locations(
                 image, model="cnn", number_of_times_to_upsample=1
             )
         return face_locations
 
-    def _apply_nms(self, boxes: List[Tuple[int, int, int, int]], threshold: float = 0.3) -> List[int]:
+    @staticmethod
+    def _apply_nms(boxes: Union[np.ndarray, List[Tuple[int, int, int, int]]], threshold: float = 0.3) -> List[int]:
         if len(boxes) == 0:
             return []
 
-        boxes_np = np.array([(left, top, right, bottom) for (top, right, bottom, left) in boxes])
+        # (top, right, bottom, left) rows -> (left, top, right, bottom) columns
+        boxes_np = np.asarray(boxes).reshape(-1, 4)[:, [3, 0, 1, 2]]
         areas = (boxes_np[:, 2] - boxes_np[:, 0] + 1) * (boxes_np[:, 3] - boxes_np[:, 1] + 1)
-        pick = []
         x1 = boxes_np[:, 0]
         y1 = boxes_np[:, 1]
         x2 = boxes_np[:, 2]
         y2 = boxes_np[:, 3]
-        idxs = np.argsort(y2)
+        # Pairwise overlap in one shot: overlap[i, j] is box j's area covered by box i
+        w = np.maximum(0, np.minimum.outer(x2, x2) - np.maximum.outer(x1, x1) + 1)
+        h = np.maximum(0, np.minimum.outer(y2, y2) - np.maximum.outer(y1, y1) + 1)
+        overlap = (w * h) / areas[None, :]
         
-        while len(idxs) > 0:
-            last = len(idxs) - 1
-            i = idxs[last]
+        # Greedy pass, highest bottom edge first; each pick masks out what it covers
+        pick = []
+        suppressed = np.zeros(len(boxes_np), dtype=bool)
+        for i in np.argsort(y2)[::-1].tolist():
+            if suppressed[i]:
+                continue
             pick.append(i)
-            xx1 = np.maximum(x1[i], x1[idxs[:last]])
-            yy1 = np.maximum(y1[i], y1[idxs[:last]])
-            xx2 = np.minimum(x2[i], x2[idxs[:last]])
-            yy2 = np.minimum(y2[i], y2[idxs[:last]])
-            w = np.maximum(0, xx2 - xx1 + 1)
-            h = np.maximum(0, yy2 - yy1 + 1)
-            overlap = (w * h) / areas[idxs[:last]]
-            idxs = np.delete(idxs, np.concatenate(([last], np.where(overlap > threshold)[0])))
+            suppressed |= overlap[i] > threshold
         
         return pick
 
@@ -80,61 +186,64 @@ class FaceRecognitionSystem:
         List[np.ndarray],
         np.ndarray
     ]:
-        if not self.known_encodings and not self.load_model():
+        if len(self.known_encodings) == 0 and not self.load_model():
             return {}, [], 0, 0.0, [], [], [], np.array([])
 
         try:
             image = self._fast_load_image(image_input)
-            unique_face_locations = set()
-            
+            locations = np.zeros((0, 4), dtype=np.int32)
+
+            # Detection cost grows with pixel count, so find faces on a downscaled copy
+            base_scale = min(1.0, DETECT_MAX_EDGE / max(image.shape[:2]))
+            detect_img = image if base_scale == 1.0 else cv2.resize(
+                image, (0, 0), fx=base_scale, fy=base_scale, interpolation=cv2.INTER_AREA
+            )
+
             for scale in [1.0, 1.25]:
-                scaled_img = cv2.resize(image, (0, 0), fx=scale, fy=scale) if scale != 1.0 else image
-                locations = self._optimized_face_locations(scaled_img)
-                
-                for (top, right, bottom, left) in locations:
-                    orig_coords = (
-                        int(top/scale),
-                        int(right/scale),
-                        int(bottom/scale), 
-                        int(left/scale)
-                    )
-                    unique_face_locations.add(orig_coords)
+                scaled_img = cv2.resize(detect_img, (0, 0), fx=scale, fy=scale) if scale != 1.0 else detect_img
+                found = self._optimized_face_locations(scaled_img)
+
+                # The upscaled pass is only a fallback for photos where nothing was found
+                if found:
+                    # Back to full-resolution (top, right, bottom, left) in one array op
+                    locations = (np.asarray(found, dtype=np.float64) / (scale * base_scale)).astype(np.int32)
+                    break
             
-            all_face_locations = list(unique_face_locations)
-            keep_indices = self._apply_nms(all_face_locations)
-            all_face_locations = [all_face_locations[i] for i in keep_indices]
+            keep_indices = self._apply_nms(locations)
+            all_face_locations = [tuple(box) for box in locations[keep_indices].tolist()]
             total_faces = len(all_face_locations)
             
             if total_faces == 0:
                 return {}, [], 0, 0.0, [], [], [], image
                 
-            face_encodings = face_recognition.face_encodings(image, all_face_locations)
-            present = {}
-            recognized_face_locations = []
-            recognition_status = [False] * total_faces
-            unrecognized_faces = []
-
-            for i, (face_encoding, face_location) in enumerate(zip(face_encodings, all_face_locations)):
-                face_distances = face_recognition.face_distance(self.known_encodings, face_encoding)
-                best_match_idx = face_distances.argmin()
-                confidence = 1 - face_distances[best_match_idx]
-
-                if confidence > min_confidence:
-                    student = self.known_metadata[best_match_idx]
-                    key = (student['roll_no'], student['name'])
-                    
-                    if key not in present or present[key] < confidence:
-                        present[key] = confidence
-                        recognition_status[i] = True
-                        recognized_face_locations.append(face_location)
-                else:
-                    top, right, bottom, left = face_location
-                    face_img = image[top:bottom, left:right]
-                    unrecognized_faces.append(face_img)
+            face_encodings = _encode_faces(image, all_face_locations)
 
-            unrecognized_count = total_faces - sum(recognition_status)
-            all_students = {(m['roll_no'], m['name']) for m in self.known_metadata}
-            absent = list(all_students - present.keys())
+            # Match every detected face against the whole gallery in one call
+            best_indices, best_distances = self._nearest(face_encodings)
+            confidences = 1.0 - best_distances
+            matched = confidences > min_confidence
+
+            # Keep the best confidence per student: sort matches by student id, then
+            # reduce each run of equal ids with a single maximum.reduceat
+            present = {}
+            student_ids = self._student_ids[best_indices[matched]]
+            if student_ids.size:
+                order = np.argsort(student_ids, kind='stable')
+                matched_ids, starts = np.unique(student_ids[order], return_index=True)
+                best_confidences = np.maximum.reduceat(confidences[matched][order], starts)
+                # tolist() yields plain floats that sqlite3/pyodbc can bind later
+                present = {self._students[s]: c for s, c in zip(matched_ids.tolist(), best_confidences.tolist())}
+
+            matched = matched.tolist()
+            recognized_face_locations = [loc for loc, ok in zip(all_face_locations, matched) if ok]
+            # Copy the crops so unrecognized entries don't pin the whole frame in memory
+            unrecognized_faces = [
+                np.ascontiguousarray(image[top:bottom, left:right])
+                for (top, right, bottom, left), ok in zip(all_face_locations, matched) if not ok
+            ]
+
+            unrecognized_count = len(unrecognized_faces)
+            absent = list(self._all_students - present.keys())
             avg_conf = sum(present.values())/len(present) if present else 0
 
             return (
@@ -151,53 +260,28 @@ class FaceRecognitionSystem:
         except Exception as e:
             print(f"Recognition error: {str(e)}")
             return {}, [], 0, 0.0, [], [], [], np.array([])
-        finally:
-            gc.collect()
 
     def recognize_single_face(self, face_image: np.ndarray, min_confidence: float = 0.5) -> Optional[Tuple[Tuple[str, str], float]]:
-        if not self.known_encodings:
+        if len(self.known_encodings) == 0:
             return None
 
         try:
-            face_encodings = face_recognition.face_encodings(face_image)
+            face_encodings = _encode_faces(face_image, face_recognition.face_locations(face_image))
             if not face_encodings:
                 return None
 
-            face_distances = face_recognition.face_distance(self.known_encodings, face_encodings[0])
-            best_match_idx = face_distances.argmin()
-            confidence = 1 - face_distances[best_match_idx]
+            best_indices, best_distances = self._nearest(face_encodings[:1])
+            best_match_idx = best_indices[0]
+            confidence = 1 - float(best_distances[0])
 
             if confidence > min_confidence:
-                student = self.known_metadata[best_match_idx]
-                return ((student['roll_no'], student['name'])), confidence
+                return self._students[self._student_ids[best_match_idx]], confidence
             return None
         except Exception as e:
             print(f"Single face recognition error: {str(e)}")
             return None
 
-    def _process_single_image(self, args: Tuple[str, str, str]) -> Optional[Tuple[np.ndarray, str, str, str]]:
-        img_path, roll_no, name = args
-        try:
-            image = self._fast_load_image(img_path)
-            if len(image.shape) == 4:
-                image = image[..., :3]
-
-            face_locations = self._optimized_face_locations(image)
-            if face_locations:
-                keep_indices = self._apply_nms(face_locations)
-                if keep_indices:
-                    face_location = face_locations[keep_indices[0]]
-                    encodings = face_recognition.face_encodings(image, [face_location])
-                    if encodings:
-                        return (encodings[0], roll_no, name, img_path)
-        except Exception as e:
-            print(f"Error processing {img_path}: {str(e)}")
-        return None
-
     def train_model(self, data_dir: str, n_jobs: int = -1) -> bool:
-        self.known_encodings = []
-        self.known_metadata = []
-
         image_paths = []
         for root, dirs, files in os.walk(data_dir):
             for file in files:
@@ -214,48 +298,105 @@ class FaceRecognitionSystem:
                         continue
 
         print(f"Processing {len(image_paths)} images...")
-        results = Parallel(n_jobs=n_jobs)(
-            delayed(self._process_single_image)(args)
-            for args in image_paths
-        )
-
-        valid_results = [r for r in results if r is not None]
+        batches = [image_paths[i:i + ENCODE_BATCH_SIZE] for i in range(0, len(image_paths), ENCODE_BATCH_SIZE)]
+        # A module-level worker means only the path batches are pickled, never self
+        # Spawn, never fork: forking the multi-threaded Streamlit server can deadlock the children
+        with _single_threaded_children(), ProcessPoolExecutor(
+                max_workers=n_jobs if n_jobs > 0 else None, initializer=_worker_init,
+                mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(_process_image_batch, batches))
+
+        _prune_thumbnail_cache()
+
+        # Build aside and swap in at the end; other sessions keep recognizing against the old gallery meanwhile
+        encodings, metadata = [], []
+        valid_results = [r for batch_results in results for r in batch_results]
         for encoding, roll_no, name, img_path in valid_results:
-            self.known_encodings.append(encoding)
-            self.known_metadata.append({
+            encodings.append(encoding)
+            metadata.append({
                 "roll_no": roll_no,
                 "name": name.replace('_', ' ').title(),
                 "image_path": os.path.abspath(img_path)
             })
 
-        if self.known_encodings:
-            self._save_model()
-            print(f"Trained on {len(self.known_encodings)} face encodings")
+        with self._model_lock:
+            self.known_encodings = encodings
+            self.known_metadata = metadata
+            self._build_indexes()
+            if encodings:
+                self._save_model()
+
+        if encodings:
+            print(f"Trained on {len(encodings)} face encodings")
             return True
         
         print("No valid faces found for training")
         return False
 
+    def _model_paths(self) -> Tuple[str, str]:
+        # model_path keeps its historical .pkl name; the model itself lives beside it
+        base = os.path.splitext(self.model_path)[0]
+        return base + ".npy", base + ".json"
+
     def _save_model(self) -> bool:
+        # A flat float32 matrix loads in one read instead of being unpickled
         try:
-            with open(self.model_path, "wb") as f:
-                pickle.dump({
-                    "encodings": self.known_encodings,
-                    "metadata": self.known_metadata
-                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            npy_path, json_path = self._model_paths()
+            # Write both files aside and swap them in, so a crash never leaves half a model
+            with open(json_path + ".tmp", "w") as f:
+                json.dump(self.known_metadata, f)
+            with open(npy_path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(self.known_encodings, dtype=np.float32).reshape(-1, 128))
+            os.replace(json_path + ".tmp", json_path)
+            # Replaced last so its mtime marks a complete save for is_stale()
+            os.replace(npy_path + ".tmp", npy_path)
             return True
         except Exception as e:
             print(f"Failed to save model: {str(e)}")
             return False
 
+    def is_stale(self, data_dir: str) -> bool:
+        """True when data_dir has gained, lost or replaced photos since the model was saved"""
+        npy_path, _ = self._model_paths()
+        if not os.path.exists(npy_path):
+            return True
+        model_mtime = os.path.getmtime(npy_path)
+        # Directory mtimes move on add/remove/rename, so there is no need to stat every photo
+        for root, _, _ in os.walk(data_dir):
+            if os.path.getmtime(root) > model_mtime:
+                return True
+        return False
+
     def load_model(self) -> bool:
         try:
+            npy_path, json_path = self._model_paths()
+            if os.path.exists(npy_path) and os.path.exists(json_path):
+                # Read fully rather than memory-mapped: the matrix is only N x 512 bytes, and
+                # an open mapping stops Windows from replacing the file on retrain or sync
+                encodings = np.load(npy_path)
+                with open(json_path) as f:
+                    metadata = json.load(f)
+                if len(encodings) != len(metadata):
+                    # A half-written or half-synced pair would attach names to the wrong faces
+                    print(f"Model files disagree: {len(encodings)} encodings, {len(metadata)} metadata entries")
+                    return False
+                with self._model_lock:
+                    self.known_encodings = encodings
+                    self.known_metadata = metadata
+                    self._build_indexes()
+                print(f"Loaded model with {len(metadata)} faces")
+                return True
             if os.path.exists(self.model_path):
                 with open(self.model_path, "rb") as f:
                     data = pickle.load(f)
+                with self._model_lock:
                     self.known_encodings = data["encodings"]
                     self.known_metadata = data["metadata"]
-                print(f"Loaded model with {len(self.known_metadata)} faces")
+                    self._build_indexes()
+                    if len(self.known_encodings) > 0:
+                        # Migrate models saved by older versions to the .npy/.json format
+                        self._save_model()
+                print(f"Loaded model with {len(data['metadata'])} faces")
                 return True
             print("No trained model found")
             return False
@@ -267,8 +408,8 @@ class FaceRecognitionSystem:
         try:
             if not drive_manager.upload_folder(local_dir, drive_folder_id):
                 return False
-            if os.path.exists(self.model_path):
-                if not drive_manager.upload_file(self.model_path, drive_folder_id):
+            for path in self._model_paths():
+                if os.path.exists(path) and not drive_manager.upload_file(path, drive_folder_id):
                     return False
             return True
         except Exception as e:
@@ -277,19 +418,187 @@ class FaceRecognitionSystem:
 
     def load_from_drive(self, drive_manager, drive_folder_id: str, local_dir: str = "student") -> bool:
         try:
-            if not drive_manager.download_folder(drive_folder_id, local_dir):
-                return False
-
-            model_file_name = os.path.basename(self.model_path)
-            model_file_id = drive_manager.find_file_by_name(model_file_name, drive_folder_id)
-
-            if model_file_id and not drive_manager.download_file(model_file_id, self.model_path):
-                return False
-
-            if os.path.exists(self.model_path):
+            # Transfer errors raise, so there is no return value to check
+            drive_manager.download_folder(drive_folder_id, local_dir)
+
+            model_files = self._model_paths()
+            # Both model files are looked up in one batched round trip
+            file_ids = drive_manager.find_files_by_name_batch(
+                [os.path.basename(path) for path in model_files], drive_folder_id)
+            for path in model_files:
+                file_id = file_ids[os.path.basename(path)]
+                if file_id:
+                    # Download aside so a failed transfer never clobbers the working model
+                    drive_manager.download_file(file_id, path + ".part")
+                    os.replace(path + ".part", path)
+
+            if all(os.path.exists(path) for path in model_files):
                 return self.load_model()
             return self.train_model(local_dir)
         except Exception as e:
             print(f"Sync failed: {str(e)}")
             return False
-        
\ No newline at end of file
+
+@contextmanager
+def _single_threaded_children():
+    """
+    Pin OpenMP/BLAS to one thread in processes spawned inside the block. The pool already
+    runs one process per core, so nested library threads would only oversubscribe. The
+    variables must be in the environment the children inherit: by the time an initializer
+    runs, the worker has imported numpy, cv2 and dlib and they have already read them.
+    Blocks are serialized, so concurrent trainings queue rather than oversubscribe each other.
+    """
+    with _thread_env_lock:
+        saved = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+        os.environ.update(dict.fromkeys(THREAD_ENV_VARS, "1"))
+        try:
+            yield
+        finally:
+            for var, value in saved.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
+
+def _worker_init() -> None:
+    # OpenCV's own pool ignores the OpenMP variables but can be capped at runtime
+    cv2.setNumThreads(1)
+    # Touch the detector, landmark and descriptor models once so the first real batch runs warm
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank)
+    _encode_faces(blank, [(0, 64, 64, 0)])
+
+def _thumbnail_cache_path(img_path: str, max_size: int = 400) -> str:
+    # Path, mtime and size key the entry, so an edited or replaced photo is decoded again
+    stat = os.stat(img_path)
+    key = hashlib.sha1(
+        f"{os.path.abspath(img_path)}|{stat.st_mtime_ns}|{stat.st_size}|{max_size}".encode()
+    ).hexdigest()
+    return os.path.join(THUMB_CACHE_DIR, key + ".npy")
+
+def _prune_thumbnail_cache(max_entries: int = THUMB_CACHE_MAX_ENTRIES) -> None:
+    """Cap the thumbnail cache at max_entries, dropping the least recently used, and clear orphaned temp files"""
+    now = time.time()
+    thumbs, doomed = [], []
+    try:
+        with os.scandir(THUMB_CACHE_DIR) as it:
+            for entry in it:
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if entry.name.endswith(".npy"):
+                    thumbs.append((mtime, entry.path))
+                elif entry.name.endswith(".tmp") and now - mtime > THUMB_TMP_MAX_AGE:
+                    doomed.append(entry.path)
+    except OSError:
+        return
+    if len(thumbs) > max_entries:
+        thumbs.sort()
+        doomed.extend(path for _, path in thumbs[:len(thumbs) - max_entries])
+    for path in doomed:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _cached_thumbnail(img_path: str, max_size: int = 400) -> np.ndarray:
+    cache_path = _thumbnail_cache_path(img_path, max_size)
+    try:
+        image = np.load(cache_path)
+        # mtime doubles as last use for the LRU cap; atime is often not maintained
+        os.utime(cache_path)
+        return image
+    except (OSError, ValueError):
+        pass
+
+    image = FaceRecognitionSystem._fast_load_image(img_path, max_size)
+    try:
+        os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+        # Training workers run in parallel; write privately, then swap in atomically
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            np.save(fh, image)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache {img_path}: {str(e)}")
+    return image
+
+def _detect_batch_cnn(batch: List[Tuple[str, str, str]], chips: queue.Queue) -> None:
+    loaded = []
+    for img_path, roll_no, name in batch:
+        try:
+            loaded.append((_cached_thumbnail(img_path), (roll_no, name, img_path)))
+        except Exception as e:
+            print(f"Error processing {img_path}: {str(e)}")
+    if not loaded:
+        return
+
+    # One minibatched CNN forward needs equal-sized frames; padding bottom/right keeps boxes valid
+    height = max(image.shape[0] for image, _ in loaded)
+    width = max(image.shape[1] for image, _ in loaded)
+    padded = [
+        np.pad(image, ((0, height - image.shape[0]), (0, width - image.shape[1]), (0, 0)))
+        for image, _ in loaded
+    ]
+    batch_locations = face_recognition.batch_face_locations(
+        padded, number_of_times_to_upsample=1, batch_size=len(padded)
+    )
+    for (image, meta), face_locations in zip(loaded, batch_locations):
+        keep_indices = FaceRecognitionSystem._apply_nms(face_locations)
+        if keep_indices:
+            chips.put((image, [face_locations[keep_indices[0]]], meta))
+
+def _detect_batch(batch: List[Tuple[str, str, str]], chips: queue.Queue) -> None:
+    try:
+        if dlib.DLIB_USE_CUDA:
+            _detect_batch_cnn(batch, chips)
+            return
+        # CPU: batched detection is CNN-only, so HOG image by image feeds the encoder sooner
+        for img_path, roll_no, name in batch:
+            try:
+                image = _cached_thumbnail(img_path)
+                face_locations = FaceRecognitionSystem._optimized_face_locations(image)
+                if face_locations:
+                    keep_indices = FaceRecognitionSystem._apply_nms(face_locations)
+                    if keep_indices:
+                        chips.put((image, [face_locations[keep_indices[0]]], (roll_no, name, img_path)))
+            except Exception as e:
+                print(f"Error processing {img_path}: {str(e)}")
+    finally:
+        chips.put(None)
+
+def _process_image_batch(batch: List[Tuple[str, str, str]]) -> List[Tuple[np.ndarray, str, str, str]]:
+    # Detection runs on a producer thread while this thread encodes the faces found so far;
+    # dlib releases the GIL in both stages, so they overlap
+    chips = queue.Queue(maxsize=32)
+    threading.Thread(target=_detect_batch, args=(batch, chips), daemon=True).start()
+
+    results, pending = [], []
+
+    def flush():
+        if not pending:
+            return
+        try:
+            encodings = _encode_image_batch([p[0] for p in pending], [p[1] for p in pending])
+            results.extend(
+                (per_image[0], roll_no, name, img_path)
+                for per_image, (_, _, (roll_no, name, img_path)) in zip(encodings, pending)
+                if per_image
+            )
+        except Exception as e:
+            print(f"Error encoding batch: {str(e)}")
+        pending.clear()
+
+    while True:
+        try:
+            item = chips.get(timeout=PIPELINE_FLUSH_SECONDS) if pending else chips.get()
+        except queue.Empty:
+            flush()
+            continue
+        if item is None:
+            flush()
+            return results
+        pending.append(item)
+        if len(pending) >= PIPELINE_ENCODE_BATCH:
+            flush()
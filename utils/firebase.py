@@ -2,7 +2,11 @@
 import firebase_admin
 from firebase_admin import credentials, storage
 import os
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# Concurrent transfers; stays under the storage client's 10-connection HTTP pool
+FIREBASE_WORKERS = 8
 
 class FirebaseStorage:
     def __init__(self, cred_path: str, bucket_name: str):
@@ -18,20 +22,33 @@ class FirebaseStorage:
             })
         self.bucket = storage.bucket()
     
+    def _upload_one(self, pair: Tuple[str, str]) -> None:
+        local_file, remote_file = pair
+        self.bucket.blob(remote_file).upload_from_filename(local_file)
+        print(f"Uploaded {local_file} to {remote_file}")
+    
     def upload_folder(self, local_path: str, remote_path: str = "student") -> None:
         """
         Upload a folder to Firebase Storage
         :param local_path: Local folder path to upload
         :param remote_path: Remote path in Firebase
         """
+        pairs = []
         for root, dirs, files in os.walk(local_path):
             for file in files:
                 local_file = os.path.join(root, file)
-                remote_file = os.path.join(remote_path, os.path.relpath(local_file, local_path))
-                
-                blob = self.bucket.blob(remote_file)
-                blob.upload_from_filename(local_file)
-                print(f"Uploaded {local_file} to {remote_file}")
+                # Object names always use '/', whatever the local separator
+                relative = os.path.relpath(local_file, local_path).replace(os.sep, "/")
+                pairs.append((local_file, f"{remote_path}/{relative}"))
+        
+        # Each upload is an independent HTTPS request, so overlap them
+        with ThreadPoolExecutor(max_workers=FIREBASE_WORKERS) as executor:
+            list(executor.map(self._upload_one, pairs))
+    
+    def _download_one(self, pair) -> None:
+        blob, local_file = pair
+        blob.download_to_filename(local_file)
+        print(f"Downloaded {blob.name} to {local_file}")
     
     def download_folder(self, remote_path: str, local_path: str) -> None:
         """
@@ -39,15 +56,15 @@ class FirebaseStorage:
         :param remote_path: Remote folder path in Firebase
         :param local_path: Local path to download to
         """
-        blobs = self.bucket.list_blobs(prefix=remote_path)
-        
-        for blob in blobs:
-            # Create local directory structure
+        pairs = []
+        for blob in self.bucket.list_blobs(prefix=remote_path):
+            # Create local directory structure before the parallel downloads start
             local_file = os.path.join(local_path, os.path.relpath(blob.name, remote_path))
             os.makedirs(os.path.dirname(local_file), exist_ok=True)
-            
-            blob.download_to_filename(local_file)
-            print(f"Downloaded {blob.name} to {local_file}")
+            pairs.append((blob, local_file))
+        
+        with ThreadPoolExecutor(max_workers=FIREBASE_WORKERS) as executor:
+            list(executor.map(self._download_one, pairs))
     
     def get_file_url(self, remote_path: str) -> Optional[str]:
         """
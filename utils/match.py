@@ -0,0 +1,90 @@
+import numpy as np
+from typing import Tuple, Optional
+
+# Optional: large galleries switch to an HNSW index when hnswlib is installed
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Below this many gallery rows one GEMM beats graph search
+ANN_MIN_GALLERY = 1024
+
+def prepare_gallery(encodings) -> np.ndarray:
+    """
+    Stack known encodings into one contiguous float32 (N, 128) matrix
+    :param encodings: List or array of 128-d face encodings
+    """
+    # float32 halves memory traffic and keeps SGEMM paths. Narrower types do not pay off here:
+    # numpy has no fp16 or int8 BLAS on CPU, so those products run as slow non-BLAS loops
+    return np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+
+def squared_norms(gallery: np.ndarray) -> np.ndarray:
+    """
+    Per-row squared L2 norms, computed once per gallery
+    :param gallery: (N, 128) matrix from prepare_gallery
+    """
+    return np.einsum("ij,ij->i", gallery, gallery)
+
+def _squared_distances(queries, gallery: np.ndarray, gallery_sqnorm: np.ndarray) -> np.ndarray:
+    queries = np.asarray(queries, dtype=gallery.dtype).reshape(-1, gallery.shape[1])
+    # ||q - d||^2 = ||q||^2 + ||d||^2 - 2 q.d
+    d2 = gallery_sqnorm[None, :] + np.einsum("ij,ij->i", queries, queries)[:, None]
+    d2 -= 2.0 * (queries @ gallery.T)
+    # Rounding can push near-identical vectors slightly below zero
+    return np.maximum(d2, 0.0, out=d2)
+
+def top_k(queries, gallery: np.ndarray, gallery_sqnorm: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the k closest gallery rows for every query, nearest first
+    :param queries: (Q, 128) probe encodings
+    :param gallery: (N, 128) matrix from prepare_gallery
+    :param gallery_sqnorm: Row norms from squared_norms(gallery)
+    :param k: Candidates per query, capped at N
+    :return: (Q, k) indices and euclidean distances
+    """
+    d2 = _squared_distances(queries, gallery, gallery_sqnorm)
+    k = min(k, d2.shape[1])
+    # argpartition is linear in N; only the k survivors get sorted
+    candidates = np.argpartition(d2, k - 1, axis=1)[:, :k]
+    candidate_d2 = np.take_along_axis(d2, candidates, axis=1)
+    if k == 1:
+        # A single survivor is already ordered
+        return candidates, np.sqrt(candidate_d2)
+    order = np.argsort(candidate_d2, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.sqrt(np.take_along_axis(candidate_d2, order, axis=1))
+
+def nearest(queries, gallery: np.ndarray, gallery_sqnorm: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the closest gallery row for every query with a single GEMM
+    :param queries: (Q, 128) probe encodings
+    :param gallery: (N, 128) matrix from prepare_gallery
+    :param gallery_sqnorm: Row norms from squared_norms(gallery)
+    :return: (indices, euclidean distances), one entry per query
+    """
+    indices, distances = top_k(queries, gallery, gallery_sqnorm, k=1)
+    return indices[:, 0], distances[:, 0]
+
+def build_ann(gallery: np.ndarray) -> Optional["hnswlib.Index"]:
+    """
+    Build an HNSW index over the gallery, or None when it is small or hnswlib is missing
+    :param gallery: (N, 128) matrix from prepare_gallery
+    """
+    if hnswlib is None or len(gallery) <= ANN_MIN_GALLERY:
+        return None
+    # l2 space keeps the same metric as nearest(); hnswlib reports squared distances
+    index = hnswlib.Index(space='l2', dim=gallery.shape[1])
+    index.init_index(max_elements=len(gallery), ef_construction=200, M=16)
+    index.add_items(gallery, np.arange(len(gallery)))
+    index.set_ef(64)
+    return index
+
+def ann_nearest(queries, index: "hnswlib.Index") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Approximate counterpart of nearest() backed by an index from build_ann
+    :param queries: (Q, 128) probe encodings
+    :return: (indices, euclidean distances), one entry per query
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, index.dim)
+    labels, d2 = index.knn_query(queries, k=1)
+    return labels[:, 0].astype(np.intp), np.sqrt(d2[:, 0])
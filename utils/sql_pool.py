@@ -0,0 +1,58 @@
+import queue
+import threading
+import pyodbc
+
+# Let the ODBC driver manager reuse physical connections too; must be set before the first connect
+pyodbc.pooling = True
+
+class ConnectionPool:
+    def __init__(self, connection_string: str, max_idle: int = 5, timeout: int = 0):
+        """
+        Keep up to max_idle open connections for one connection string
+        :param connection_string: ODBC connection string
+        :param max_idle: Connections retained between uses; extras are closed on release
+        :param timeout: Login timeout in seconds for new connections
+        """
+        self.connection_string = connection_string
+        self.timeout = timeout
+        # LIFO hands back the most recently used connection, the one least likely to fail its ping
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def acquire(self) -> pyodbc.Connection:
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return pyodbc.connect(self.connection_string, timeout=self.timeout)
+            # An idle connection may have outlived a server restart or network drop; one
+            # round trip proves it, and callers probing reachability rely on that
+            try:
+                connection.execute("SELECT 1").fetchone()
+                return connection
+            except pyodbc.Error:
+                try:
+                    connection.close()
+                except pyodbc.Error:
+                    pass
+
+    def release(self, connection: pyodbc.Connection) -> None:
+        if not isinstance(connection, pyodbc.Connection):
+            raise TypeError(f"ConnectionPool only holds pyodbc connections, got {type(connection).__name__}")
+        try:
+            # Never hand an open transaction to the next borrower
+            if not connection.autocommit:
+                connection.rollback()
+            self._idle.put_nowait(connection)
+        except (queue.Full, pyodbc.Error):
+            connection.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(connection_string: str, **kwargs) -> ConnectionPool:
+    """Return the process-wide pool for a connection string, creating it on first use"""
+    with _pools_lock:
+        pool = _pools.get(connection_string)
+        if pool is None:
+            pool = _pools[connection_string] = ConnectionPool(connection_string, **kwargs)
+        return pool